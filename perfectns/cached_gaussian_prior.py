@@ -7,6 +7,7 @@ numerical instability for very low values of X, which are reached in
 high dimensional problems.
 """
 
+import os
 import warnings
 import numpy as np
 import nestcheck.io_utils as iou
@@ -66,9 +67,10 @@ def interp_r_logx_dict(n_dim, prior_scale, **kwargs):
         logx_max = kwargs.pop('logx_max', -200)
     if kwargs:
         raise TypeError('Unexpected **kwargs: {0}'.format(kwargs))
-    save_name = (cache_dir + '/interp_gauss_prior_' + str(n_dim) + 'd_' +
-                 str(prior_scale) + 'rmax_' + str(logx_min) + 'xmin_' +
-                 str(logx_max) + 'xmax_' + str(interp_density) + 'id')
+    save_name = os.path.join(
+        cache_dir, ('interp_gauss_prior_' + str(n_dim) + 'd_' +
+                    str(prior_scale) + 'rmax_' + str(logx_min) + 'xmin_' +
+                    str(logx_max) + 'xmax_' + str(interp_density) + 'id'))
     try:
         interp_dict = iou.pickle_load(save_name)
     except (OSError, IOError):  # Python 2 and 3 compatable
@@ -76,8 +78,8 @@ def interp_r_logx_dict(n_dim, prior_scale, **kwargs):
         print('Interp file not found - try generating new data')
         r_max = mf.gaussian_r_given_logx(logx_max, prior_scale, n_dim)
         # Iteratively reduce r_min until its corresponding logx value is less
-        # than logx_min. This process depends only on mpmath functions which
-        # can handle arbitrarily small numbers.
+        # than logx_min. gaussian_logx_given_r falls back on mpmath where
+        # scipy underflows, so it can handle arbitrarily small numbers.
         r_min = r_max
         while mf.gaussian_logx_given_r(r_min, prior_scale, n_dim) > logx_min:
             r_min /= 2.0
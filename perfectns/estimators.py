@@ -29,13 +29,22 @@ Estimators should also contain class variables:
 
 """
 
+import collections
 import functools
 import numpy as np
 import scipy
+import scipy.integrate
 import perfectns.maths_functions as mf
 import nestcheck.ns_run_utils
 import nestcheck.estimators
 
+# check_by_integrating results, keyed by ftilde and integration_settings_key
+# and ordered from least to most recently used. At most
+# INTEGRATION_CACHE_SIZE values are kept so parameter sweeps do not grow the
+# cache without limit.
+INTEGRATION_CACHE = collections.OrderedDict()
+INTEGRATION_CACHE_SIZE = 128
+
 
 # Estimators
 # ----------
@@ -275,10 +284,9 @@ class RCred(EstimatorBase):
                 logw = nestcheck.ns_run_utils.get_logw(
                     ns_run, simulate=simulate)
             # get sorted array of r values with their posterior weight
-            wr = np.zeros((logw.shape[0], 2))
-            wr[:, 0] = np.exp(logw - logw.max())
-            wr[:, 1] = ns_run['r']
-            wr = wr[np.argsort(wr[:, 1], axis=0)]
+            sort_inds = np.argsort(ns_run['r'])
+            r_sorted = ns_run['r'][sort_inds]
+            w_sorted = np.exp(logw[sort_inds] - logw.max())
             # calculate cumulative distribution function (cdf)
             # Adjust by subtracting 0.5 * weight of first point to correct skew
             # - otherwise we need cdf=1 to return the last value but will
@@ -287,11 +295,12 @@ class RCred(EstimatorBase):
             # This should not much matter as typically points' relative weights
             # will be very small compared to self.probability or
             # 1-self.probability.
-            cdf = np.cumsum(wr[:, 0]) - (wr[0, 0] / 2)
-            cdf /= np.sum(wr[:, 0])
+            cdf = np.cumsum(w_sorted)
+            cdf -= w_sorted[0] / 2
+            cdf /= np.sum(w_sorted)
             # calculate cdf
             # linearly interpolate value
-            return np.interp(self.probability, cdf, wr[:, 1])
+            return np.interp(self.probability, cdf, r_sorted)
 
 
 # Functions for checking estimator results
@@ -342,6 +351,11 @@ def check_by_integrating(ftilde, settings):
     where ftilde(X) is mean of f(theta) on the iso-likelihood contour
     L(theta) = L(X).
 
+    Results are memoized on ftilde and the settings which determine the
+    integral (see integration_settings_key), so repeated calls for the same
+    problem do not repeat the quadrature. Use clear_integration_cache to
+    empty the cache.
+
     Parameters
     ----------
     ftilde: function
@@ -352,12 +366,55 @@ def check_by_integrating(ftilde, settings):
     float
         The estimator's true value.
     """
+    key = (ftilde, integration_settings_key(settings))
+    try:
+        INTEGRATION_CACHE.move_to_end(key)
+        return INTEGRATION_CACHE[key]
+    except KeyError:
+        pass
     logx_terminate = mf.analytic_logx_terminate(settings)
     assert logx_terminate is not None, \
         'logx_terminate function not set up for current settings'
     result = scipy.integrate.quad(check_integrand, logx_terminate,
                                   0.0, args=(ftilde, settings))
-    return result[0] / np.exp(settings.logz_analytic())
+    if len(INTEGRATION_CACHE) >= INTEGRATION_CACHE_SIZE:
+        # remove the least recently used value
+        INTEGRATION_CACHE.popitem(last=False)
+    INTEGRATION_CACHE[key] = result[0] / np.exp(settings.logz_analytic())
+    return INTEGRATION_CACHE[key]
+
+
+def integration_settings_key(settings):
+    """
+    Hashable summary of the settings which affect check_by_integrating's
+    output: the number of dimensions, the termination fraction and the
+    likelihood and prior types and parameters. For GaussianCached priors
+    this includes the interpolation parameters logx_min and interp_density,
+    which change r_given_logx.
+
+    Parameters
+    ----------
+    settings: PerfectNSSettings object
+
+    Returns
+    -------
+    tuple
+    """
+    settings_dict = settings.get_settings_dict()
+    prior_args = settings_dict['prior_args']
+    if settings_dict['prior'] == 'GaussianCached':
+        prior_args = {'prior_scale': settings.prior.prior_scale,
+                      'logx_min': settings.prior.logx_min,
+                      'interp_density': settings.prior.interp_density}
+    return (settings_dict['n_dim'], settings_dict['termination_fraction'],
+            settings_dict['likelihood'],
+            tuple(sorted(settings_dict['likelihood_args'].items())),
+            settings_dict['prior'], tuple(sorted(prior_args.items())))
+
+
+def clear_integration_cache():
+    """Empty the cache of check_by_integrating results."""
+    INTEGRATION_CACHE.clear()
 
 
 def check_integrand(logx, ftilde, settings):
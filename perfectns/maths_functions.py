@@ -4,12 +4,10 @@ Mathematical functions.
 """
 
 
+import functools
 import numpy as np
 import scipy
-import scipy.stats
 import scipy.special
-import scipy.misc
-import mpmath
 
 
 def gaussian_r_given_logx(logx, sigma, n_dim):
@@ -35,7 +33,7 @@ def gaussian_r_given_logx(logx, sigma, n_dim):
         Radial coordinates corresponding to input log X values.
     """
     exponent = scipy.special.gammaincinv(n_dim / 2., np.exp(logx))
-    return np.sqrt(2 * exponent * sigma ** 2)
+    return np.sqrt(2 * exponent) * sigma
 
 
 def gaussian_logx_given_r(r, sigma, n_dim):
@@ -43,7 +41,9 @@ def gaussian_logx_given_r(r, sigma, n_dim):
     Returns logx coordinate corresponding to r values for a Gaussian prior with
     the specificed standard deviation and dimension
 
-    Uses mpmath package for arbitary precision.
+    Uses scipy.special.gammainc (or gammaincc for logx close to zero),
+    falling back on the mpmath package for arbitary precision where scipy's
+    result underflows (very low logx).
 
     Parameters
     ----------
@@ -60,15 +60,48 @@ def gaussian_logx_given_r(r, sigma, n_dim):
         Logx coordinates corresponding to input radial coordinates.
     """
     exponent = 0.5 * (r / sigma) ** 2
+    with np.errstate(divide='ignore'):
+        # When X is close to 1 taking the log of gammainc loses relative
+        # precision, so use log1p of the complementary function instead
+        logx = np.where(
+            exponent > n_dim / 2.,
+            np.log1p(-scipy.special.gammaincc(n_dim / 2., exponent)),
+            np.log(scipy.special.gammainc(n_dim / 2., exponent)))
+    # Below the smallest normal float scipy's result loses precision or
+    # underflows to zero
+    logx_min = np.log(np.finfo(float).tiny)
     if isinstance(r, np.ndarray):  # needed to ensure output is numpy array
-        logx = np.zeros(r.shape)
-        for i, expo in enumerate(exponent):
-            logx[i] = float(mpmath.log(mpmath.gammainc(n_dim / 2., a=0, b=expo,
-                                                       regularized=True)))
+        for i in np.where(logx < logx_min)[0]:
+            logx[i] = mpmath_gaussian_logx_given_exponent(exponent[i], n_dim)
         return logx
+    elif logx < logx_min:
+        return mpmath_gaussian_logx_given_exponent(exponent, n_dim)
     else:
-        return float(mpmath.log(mpmath.gammainc(n_dim / 2., a=0, b=exponent,
-                                                regularized=True)))
+        return float(logx)
+
+
+def mpmath_gaussian_logx_given_exponent(exponent, n_dim):
+    """
+    Returns logx coordinate for a Gaussian prior using mpmath's arbitrary
+    precision regularized lower incomplete gamma function. This is much slower
+    than scipy.special.gammainc but can handle arbitrarily small X values.
+
+    Parameters
+    ----------
+    exponent: float
+        Value of 0.5 * (r / sigma) ** 2.
+    n_dim: int
+        Number of dimensions.
+
+    Returns
+    -------
+    float
+    """
+    # Imported here as mpmath is only needed for the rare logx values which
+    # underflow scipy.special.gammainc.
+    import mpmath
+    return float(mpmath.log(mpmath.gammainc(n_dim / 2., a=0, b=exponent,
+                                            regularized=True)))
 
 
 def analytic_logx_terminate(settings):
@@ -125,7 +158,7 @@ def logx_terminate_bound(logl_max, termination_fraction, logz_analytic):
     return np.log(termination_fraction) + logz_analytic - logl_max
 
 
-def sample_nsphere_shells_beta(r, n_dim, n_sample=None):
+def sample_nsphere_shells_beta(r, n_dim, n_sample=None, rng=None):
     """
     Given some 1d numpy array of radial coordinates r, return a numpy array
     of sample coordinates on the hyperspherical shells with each radial
@@ -142,8 +175,9 @@ def sample_nsphere_shells_beta(r, n_dim, n_sample=None):
     samples are returned (by symmetry they all have the same distribution).
     This is useful for saving memory in high dimensions.
 
-    This function is much quicker than sample_nsphere_shells_normal when n_dim
-    is high and n_sample is low.
+    Like sample_nsphere_shells_normal, this only needs random numbers for the
+    n_sample parameters returned, so it is quick when n_dim is high and
+    n_sample is low.
 
     Parameters
     ----------
@@ -151,6 +185,9 @@ def sample_nsphere_shells_beta(r, n_dim, n_sample=None):
     n_dim: int
     n_sample: int or None, optional
         Number of parameters to include in output for each sample.
+    rng: numpy.random.Generator or None, optional
+        Random number generator to use. If None, the legacy numpy global
+        random state is used.
 
     Returns
     -------
@@ -159,18 +196,20 @@ def sample_nsphere_shells_beta(r, n_dim, n_sample=None):
         corresponding input r coordinate.
     """
     assert isinstance(r, np.ndarray), 'input r must be a numpy array'
+    if rng is None:
+        rng = np.random
     if n_sample is None:
         n_sample = n_dim
-    thetas = np.sqrt(np.random.beta(0.5, (n_dim - 1) * 0.5,
-                                    size=(r.shape[0], n_sample)))
+    thetas = rng.beta(0.5, (n_dim - 1) * 0.5, size=(r.shape[0], n_sample))
+    np.sqrt(thetas, out=thetas)
     # randomly select + or -
-    thetas *= (-1) ** (np.random.randint(0, 2, size=thetas.shape))
+    thetas *= rng.choice((1, -1), size=thetas.shape)
     # multiply by r
     thetas *= r[:, None]
     return thetas
 
 
-def sample_nsphere_shells_normal(r, n_dim, n_sample=None):
+def sample_nsphere_shells_normal(r, n_dim, n_sample=None, rng=None):
     """
     Given some 1d numpy array of radial coordinates r, return a numpy array
     of sample coordinates on the hyperspherical shells with each radial
@@ -178,7 +217,12 @@ def sample_nsphere_shells_normal(r, n_dim, n_sample=None):
 
     This works by using the symmetry of the normal distribution to sample
     isotropically, then normalising each set of samples to lie on a spherical
-    shell of the correct radius.
+    shell of the correct radius. If a numpy Generator is provided, only the
+    n_sample coordinates returned are drawn explicitly; the sum of squares of
+    the remaining n_dim - n_sample coordinates needed for the normalisation is
+    drawn directly from a chi-squared distribution. With the legacy numpy
+    random state every coordinate is drawn, so runs made with a given
+    random_seed are unchanged.
 
     The n_sample argument can be used to set the number of parameters for which
     samples are returned (by symmetry they all have the same distribution).
@@ -190,6 +234,9 @@ def sample_nsphere_shells_normal(r, n_dim, n_sample=None):
     n_dim: int
     n_sample: int or None, optional
         Number of parameters to include in output for each sample.
+    rng: numpy.random.Generator or None, optional
+        Random number generator to use. If None, the legacy numpy global
+        random state is used.
 
     Returns
     -------
@@ -197,20 +244,32 @@ def sample_nsphere_shells_normal(r, n_dim, n_sample=None):
         Each row is a random sample from the shells defined by the
         corresponding input r coordinate.
     """
+    if rng is None:
+        rng = np.random
     if n_sample is None:
         n_sample = n_dim
     assert n_sample <= n_dim, 'so far only set up for nsample <= ndim'
-    thetas = np.random.normal(size=(r.shape[0], n_dim))
+    if isinstance(rng, np.random.Generator):
+        thetas = rng.standard_normal(size=(r.shape[0], n_sample))
+        # row-wise sum of squares without allocating a squared copy of thetas
+        norm_sq = np.einsum('ij,ij->i', thetas, thetas)
+        if n_sample < n_dim:
+            norm_sq += rng.chisquare(n_dim - n_sample, size=r.shape[0])
+    else:
+        # Draw all n_dim coordinates to keep the legacy random stream
+        thetas = rng.standard_normal(size=(r.shape[0], n_dim))
+        norm_sq = np.einsum('ij,ij->i', thetas, thetas)
+        # only return n_sample columns
+        thetas = thetas[:, :n_sample]
     # calculate normalisation so sum_i(theta_i^2) = r^2 for each row
-    norm = r / np.sqrt(np.sum(thetas ** 2, axis=1))
-    # only return n_sample columns
-    thetas = thetas[:, :n_sample]
+    norm = np.sqrt(norm_sq, out=norm_sq)
+    np.divide(r, norm, out=norm)
     # normalise each column
     thetas *= norm[:, None]
     return thetas
 
 
-def sample_nsphere_shells(r, n_dim, n_sample):
+def sample_nsphere_shells(r, n_dim, n_sample, rng=None):
     """
     Wrapper calling either sample_nsphere_shells_normal or
     sample_nsphere_shells_beta depending on the dimension and
@@ -220,9 +279,9 @@ def sample_nsphere_shells(r, n_dim, n_sample):
     sample_nsphere_shells_beta for more information.
     """
     if n_dim >= 100 and n_sample <= 2:
-        return sample_nsphere_shells_beta(r, n_dim, n_sample)
+        return sample_nsphere_shells_beta(r, n_dim, n_sample, rng=rng)
     else:
-        return sample_nsphere_shells_normal(r, n_dim, n_sample)
+        return sample_nsphere_shells_normal(r, n_dim, n_sample, rng=rng)
 
 
 def nsphere_r_given_logx(logx, r_max, n_dim):
@@ -305,11 +364,29 @@ def log_gaussian_given_r(r, sigma, n_dim):
     logl: float or numpy array
         Loglikelihood values corresponding to input radial coordinates.
     """
-    logl = -0.5 * ((r ** 2) / (sigma ** 2))
-    # normalise
-    logl -= n_dim * np.log(sigma)
-    logl -= np.log(2 * np.pi) * (n_dim / 2.0)
-    return logl
+    return (-0.5 / (sigma * sigma)) * (r * r) + log_gaussian_norm(sigma, n_dim)
+
+
+@functools.lru_cache(maxsize=None)
+def log_gaussian_norm(sigma, n_dim):
+    """
+    Returns the log normalisation constant of a normalised, uncorrelated
+    Gaussian likelihood with equal variance in all n_dim dimensions (its
+    value at r=0).
+
+    The normalisation constants are memoized as they are needed on every
+    likelihood evaluation but only change with the settings.
+
+    Parameters
+    ----------
+    sigma: float
+    n_dim: int
+
+    Returns
+    -------
+    float
+    """
+    return -n_dim * np.log(sigma) - np.log(2 * np.pi) * (n_dim / 2.0)
 
 
 def log_exp_power_given_r(r, sigma, n_dim, b=0.5):
@@ -329,14 +406,16 @@ def log_exp_power_given_r(r, sigma, n_dim, b=0.5):
     logl: float or numpy array
         Loglikelihood values corresponding to input radial coordinates.
     """
-    logl = -0.5 * (((r ** 2) / (sigma ** 2)) ** b)
-    # normalise
-    logl += np.log(n_dim)
-    logl += scipy.special.gammaln((n_dim) / 2.0)
-    logl -= np.log(np.pi) * (n_dim / 2.0)
-    logl -= n_dim * np.log(sigma)
-    logl -= np.log(2) * (1 + 0.5 * b)
-    logl -= scipy.special.gammaln(1. + ((n_dim) / (2 * b)))
+    # Raise |r| / sigma to the power 2b in one step rather than squaring and
+    # then taking the b-th power; the default b=0.5 needs no power at all.
+    r_scaled = np.abs(r) / sigma
+    if b == 0.5:
+        logl = -0.5 * r_scaled
+    elif b == 1:
+        logl = -0.5 * (r_scaled * r_scaled)
+    else:
+        logl = -0.5 * (r_scaled ** (2 * b))
+    logl += log_exp_power_norm(sigma, n_dim, b)
     return logl
 
 
@@ -358,16 +437,35 @@ def r_given_log_exp_power(logl, sigma, n_dim, b=0.5):
         Radial coordinates corresponding to input logl values.
     """
     # remove normalisation constant
-    exponent = logl - np.log(n_dim)
-    exponent -= scipy.special.gammaln((n_dim) / 2.0)
-    exponent += np.log(np.pi) * (n_dim / 2.0)
-    exponent += n_dim * np.log(sigma)
-    exponent += np.log(2) * (1 + 0.5 * b)
-    exponent += scipy.special.gammaln(1. + ((n_dim) / (2 * b)))
+    exponent = logl - log_exp_power_norm(sigma, n_dim, b)
     # rearrange
-    exponent = (-2. * exponent) ** (1. / b)
-    logl = np.sqrt(exponent * (sigma ** 2))
-    return logl
+    if b == 0.5:
+        return (-2. * exponent) * sigma
+    elif b == 1:
+        return np.sqrt(-2. * exponent) * sigma
+    return ((-2. * exponent) ** (0.5 / b)) * sigma
+
+
+@functools.lru_cache(maxsize=None)
+def log_exp_power_norm(sigma, n_dim, b=0.5):
+    """
+    Returns the log normalisation constant of an exponential power
+    distribution (its value at r=0).
+
+    Parameters
+    ----------
+    sigma: float
+    n_dim: int
+    b: float, optional
+
+    Returns
+    -------
+    float
+    """
+    return (np.log(n_dim) + scipy.special.gammaln((n_dim) / 2.0)
+            - np.log(np.pi) * (n_dim / 2.0) - n_dim * np.log(sigma)
+            - np.log(2) * (1 + 0.5 * b)
+            - scipy.special.gammaln(1. + ((n_dim) / (2 * b))))
 
 
 def r_given_log_gaussian(logl, sigma, n_dim):
@@ -386,11 +484,8 @@ def r_given_log_gaussian(logl, sigma, n_dim):
     r: float or numpy array
         Radial coordinates corresponding to input logl values.
     """
-    # remove normalisation constant
-    exponent = logl + n_dim * np.log(sigma)
-    exponent += np.log(2 * np.pi) * (n_dim / 2.0)
-    # rearrange
-    r = np.sqrt(-2 * exponent) * sigma
+    # remove normalisation constant and rearrange
+    r = np.sqrt(2 * (log_gaussian_norm(sigma, n_dim) - logl)) * sigma
     return r
 
 
@@ -410,10 +505,8 @@ def log_cauchy_given_r(r, sigma, n_dim):
     logl: float or numpy array
         Loglikelihood values corresponding to input radial coordinates.
     """
-    logl = (-(1 + n_dim) / 2) * np.log(1 + ((r ** 2) / (sigma ** 2)))
-    logl += scipy.special.gammaln((1.0 + n_dim) / 2.0)
-    logl -= np.log(np.pi) * (n_dim + 1.0) / 2.0  # NB gamma(0.5) = sqrt(pi)
-    logl += (-n_dim) * np.log(sigma)
+    logl = (-(1 + n_dim) / 2) * np.log1p((r * r) / (sigma * sigma))
+    logl += log_cauchy_norm(sigma, n_dim)
     return logl
 
 
@@ -433,14 +526,28 @@ def r_given_log_cauchy(logl, sigma, n_dim):
     r: float or numpy array
         Radial coordinates corresponding to input logl values.
     """
-    exponent = logl
-    # remove normalisation constant
-    exponent -= scipy.special.gammaln((1.0 + n_dim) / 2.0)
-    exponent += np.log(np.pi) * (n_dim + 1.0) / 2.0  # NB gamma(0.5) = sqrt(pi)
-    exponent -= (-n_dim) * np.log(sigma)
-    # remove power
-    exponent /= -(n_dim + 1.0) / 2.0
-    # rearrange
-    exponent = np.exp(exponent) - 1.0
-    r_squared = exponent * (sigma ** 2)
+    # remove normalisation constant and power
+    exponent = (logl - log_cauchy_norm(sigma, n_dim)) * (-2.0 / (n_dim + 1.0))
+    # rearrange (use expm1 to preserve precision for r << sigma)
+    r_squared = np.expm1(exponent) * (sigma * sigma)
     return np.sqrt(r_squared)
+
+
+@functools.lru_cache(maxsize=None)
+def log_cauchy_norm(sigma, n_dim):
+    """
+    Returns the log normalisation constant of a normalised, uncorrelated
+    Cauchy distribution with 1 degree of freedom (its value at r=0).
+
+    Parameters
+    ----------
+    sigma: float
+    n_dim: int
+
+    Returns
+    -------
+    float
+    """
+    return (scipy.special.gammaln((1.0 + n_dim) / 2.0)
+            - np.log(np.pi) * (n_dim + 1.0) / 2.0  # NB gamma(0.5) = sqrt(pi)
+            - n_dim * np.log(sigma))
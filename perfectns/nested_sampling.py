@@ -7,6 +7,7 @@ Nested sampling runs are stored a format compatible with the nestcheck
 package.
 """
 
+import os
 import warnings
 import copy
 import numpy as np
@@ -17,7 +18,7 @@ import nestcheck.io_utils as iou
 import perfectns.maths_functions as mf
 
 
-def generate_ns_run(settings, random_seed=None):
+def generate_ns_run(settings, random_seed=None, rng=None):
     """
     Performs perfect nested sampling calculation and returns a nested sampling
     run in the form of a dictionary.
@@ -34,7 +35,13 @@ def generate_ns_run(settings, random_seed=None):
         Set numpy random seed. Default is to use None (so a random seed is
         chosen from the computer's internal state) to ensure reliable results
         when multiprocessing. Can set to an integer or to False to not edit the
-        seed.
+        seed. Must be None or False if rng is specified, as the seed would
+        have no effect; runs made with an rng therefore have 'random_seed'
+        None or False rather than a value which did not generate them.
+    rng: numpy.random.Generator or None, optional
+        Random number generator to use for all random draws, for example
+        numpy.random.default_rng(seed) (which uses PCG64). If None, the legacy
+        numpy global random state, seeded with random_seed, is used.
 
     Returns
     -------
@@ -58,12 +65,16 @@ def generate_ns_run(settings, random_seed=None):
             'thread_labels': 1d array listing the threads each sample belongs
                               to.
     """
-    if random_seed is not False:
+    if rng is not None:
+        assert random_seed is None or random_seed is False, (
+            'random_seed=' + str(random_seed) + ' has no effect when rng is '
+            'specified - seed the rng instead')
+    elif random_seed is not False:
         np.random.seed(random_seed)
     if settings.dynamic_goal is None:
-        run = generate_standard_run(settings)
+        run = generate_standard_run(settings, rng=rng)
     else:
-        run = generate_dynamic_run(settings)
+        run = generate_dynamic_run(settings, rng=rng)
     run['random_seed'] = random_seed
     return run
 
@@ -120,7 +131,7 @@ def get_run_data(settings, n_repeat, **kwargs):
     assert len(random_seeds) == n_repeat
     if kwargs:
         raise TypeError('Unexpected **kwargs: {0}'.format(kwargs))
-    save_name = cache_dir + '/' + settings.save_name()
+    save_name = os.path.join(cache_dir, settings.save_name())
     save_name += '_' + str(n_repeat) + 'reps'
     if load:
         try:
@@ -128,8 +139,11 @@ def get_run_data(settings, n_repeat, **kwargs):
             if check_loaded_settings:
                 # Assume all runs in the loaded list have the same settings, in
                 # which case we only need check the first one.
-                loaded = copy.deepcopy(data[0]['settings'])
-                current = copy.deepcopy(settings.get_settings_dict())
+                # Only top-level keys are deleted below, so a shallow copy
+                # of the loaded settings suffices (get_settings_dict already
+                # returns a new dict).
+                loaded = dict(data[0]['settings'])
+                current = settings.get_settings_dict()
                 # If runs are standard nested sampling there is no need to
                 # check settings which only affect dynamic ns match
                 if loaded['dynamic_goal'] is None and (current['dynamic_goal']
@@ -174,7 +188,7 @@ def get_run_data(settings, n_repeat, **kwargs):
     return data
 
 
-def generate_standard_run(settings, is_dynamic_initial_run=False):
+def generate_standard_run(settings, is_dynamic_initial_run=False, rng=None):
     """
     Performs standard nested sampling using the likelihood and prior specified
     in settings.
@@ -191,6 +205,9 @@ def generate_standard_run(settings, is_dynamic_initial_run=False):
     is_dynamic_initial_run: bool, optional
         Set to True if this is the initial exploratory run in dynamic nested
         sampling.
+    rng: numpy.random.Generator or None, optional
+        Random number generator to use. If None, the legacy numpy global
+        random state is used.
 
     Returns
     -------
@@ -199,6 +216,8 @@ def generate_standard_run(settings, is_dynamic_initial_run=False):
         posterior samples and a record of the settings used. See docstring for
         generate_ns_run for more details.
     """
+    if rng is None:
+        rng = np.random
     if is_dynamic_initial_run:
         nlive_const = settings.ninit
     else:
@@ -208,7 +227,7 @@ def generate_standard_run(settings, is_dynamic_initial_run=False):
     live_points = np.zeros((nlive_const, 4))
     # Thread labels are 1 to nlive_const
     live_points[:, 3] = np.arange(nlive_const)
-    live_points[:, 2] = np.log(np.random.random(live_points.shape[0]))
+    live_points[:, 2] = np.log(rng.random(live_points.shape[0]))
     live_points[:, 1] = settings.r_given_logx(live_points[:, 2])
     live_points[:, 0] = settings.logl_given_r(live_points[:, 1])
     # termination condition variables
@@ -227,10 +246,10 @@ def generate_standard_run(settings, is_dynamic_initial_run=False):
         dead_points_list.append(copy.deepcopy(live_points[ind, :]))
         # update dead evidence estimates
         logx_i += -1.0 / nlive_const
-        logz_dead = scipy.special.logsumexp((logz_dead, live_points[ind, 0] +
-                                             logtrapz + logx_i))
+        logz_dead = np.logaddexp(logz_dead, live_points[ind, 0] + logtrapz +
+                                 logx_i)
         # add new point
-        live_points[ind, 2] += np.log(np.random.random())
+        live_points[ind, 2] += np.log(rng.random())
         live_points[ind, 1] = settings.r_given_logx(live_points[ind, 2])
         live_points[ind, 0] = settings.logl_given_r(live_points[ind, 1])
         logz_live = (scipy.special.logsumexp(live_points[:, 0]) + logx_i -
@@ -247,13 +266,14 @@ def generate_standard_run(settings, is_dynamic_initial_run=False):
     # add array of parameter values sampled from the hyperspheres corresponding
     # to the radial coordinate of each point.
     run['theta'] = mf.sample_nsphere_shells(run['r'], settings.n_dim,
-                                            settings.dims_to_sample)
+                                            settings.dims_to_sample, rng=rng)
     # Add an array of the local number of live points - this equals nlive_const
     # until the run terminates, at which point it reduces by 1 as each thread
     # ends.
-    run['nlive_array'] = np.zeros(run['logl'].shape[0]) + nlive_const
-    for i in range(1, nlive_const):
-        run['nlive_array'][-i] = i
+    n_samples = run['logl'].shape[0]
+    run['nlive_array'] = np.full(n_samples, float(nlive_const))
+    run['nlive_array'][n_samples - nlive_const + 1:] = np.arange(
+        nlive_const - 1, 0, -1)
     # Get array of data on threads' beginnings and ends. Each starts by
     # sampling the whole prior and ends on one of the final live points.
     run['thread_min_max'] = np.zeros((nlive_const, 2))
@@ -266,7 +286,7 @@ def generate_standard_run(settings, is_dynamic_initial_run=False):
 # --------------------
 
 
-def generate_dynamic_run(settings):
+def generate_dynamic_run(settings, rng=None):
     """
     Generate a dynamic nested sampling run.
     For details of the dynamic nested sampling algorithm, see 'Dynamic nested
@@ -285,6 +305,9 @@ def generate_dynamic_run(settings):
         settings.dynamic_goal controls whether the algorithm aims to increase
         parameter estimation accuracy (dynamic_goal=1), evidence accuracy
         (dynamic_goal=0) or places some weight on both.
+    rng: numpy.random.Generator or None, optional
+        Random number generator to use. If None, the legacy numpy global
+        random state is used.
 
     Returns
     -------
@@ -297,7 +320,8 @@ def generate_dynamic_run(settings):
         str(settings.dynamic_goal) + ' should be between 0 and 1'
     # Step 1: initial exploratory standard ns run with ninit live points
     # ------------------------------------------------------------------
-    standard_run = generate_standard_run(settings, is_dynamic_initial_run=True)
+    standard_run = generate_standard_run(settings, is_dynamic_initial_run=True,
+                                         rng=rng)
     # create samples array with columns:
     # [logl, r, logx, thread label, change in nlive, params]
     samples = samples_array_given_run(standard_run)
@@ -314,25 +338,32 @@ def generate_dynamic_run(settings):
         logl_min_max, logx_min_max = min_max_importance(importance,
                                                         samples,
                                                         settings)
+        # All threads in the batch start from the same point, so look it up
+        # once and note that nlive increases by 1 for each new thread
+        if logl_min_max[0] != -np.inf:
+            # check there is exactly one point with the likelihood at which
+            # the new threads start
+            start_ind = unique_sorted_index(samples[:, 0], logl_min_max[0])
+            samples[start_ind, 4] += settings.nbatch
+        # Collect the batch's threads and their starting and ending logls,
+        # then add them to samples and thread_min_max in a single
+        # concatenation rather than reallocating the arrays for each thread
+        new_threads = []
+        new_thread_min_max = []
         for _ in range(settings.nbatch):
             # make new thread
-            thread_label = thread_min_max.shape[0]
+            thread_label = thread_min_max.shape[0] + len(new_threads)
             thread = generate_single_thread(settings,
                                             logx_min_max[1],
                                             thread_label,
                                             logx_start=logx_min_max[0],
-                                            keep_final_point=True)
+                                            keep_final_point=True, rng=rng)
             # update run
-            if logl_min_max[0] != -np.inf:
-                start_ind = np.where(samples[:, 0] == logl_min_max[0])[0]
-                # check there is exactly one point with the likelihood at which
-                # the new thread starts, and note that nlive increases by 1
-                assert start_ind.shape == (1,)
-                samples[start_ind, 4] += 1
-            samples = np.vstack((samples, thread))
-            lmm = np.asarray([logl_min_max[0], thread[-1, 0]])
-            thread_min_max = np.vstack((thread_min_max, lmm))
+            new_threads.append(thread)
+            new_thread_min_max.append([logl_min_max[0], thread[-1, 0]])
+        thread_min_max = np.vstack((thread_min_max, new_thread_min_max))
         # sort array and update n_samples in preparation for the next iteration
+        samples = np.concatenate([samples] + new_threads)
         samples = samples[np.argsort(samples[:, 0])]
         n_samples = samples.shape[0]
     # To compute nlive from the changes in nlive at each step, first find nlive
@@ -347,7 +378,8 @@ def generate_dynamic_run(settings):
 # ------------------------------
 
 
-def generate_thread_logx(logx_end, logx_start=0, keep_final_point=True):
+def generate_thread_logx(logx_end, logx_start=0, keep_final_point=True,
+                         rng=None):
     """
     Generate logx co-ordinates of a new nested sampling thread (single live
     point run).
@@ -361,21 +393,26 @@ def generate_thread_logx(logx_end, logx_start=0, keep_final_point=True):
         whole prior.
     keep_final_point: bool, optional
         If False, the final point with logx less than logx_end is removed.
+    rng: numpy.random.Generator or None, optional
+        Random number generator to use. If None, the legacy numpy global
+        random state is used.
 
     Returns
     -------
     logx_list: list of floats
     """
-    logx_list = [logx_start + np.log(np.random.random())]
+    if rng is None:
+        rng = np.random
+    logx_list = [logx_start + np.log(rng.random())]
     while logx_list[-1] > logx_end:
-        logx_list.append(logx_list[-1] + np.log(np.random.random()))
+        logx_list.append(logx_list[-1] + np.log(rng.random()))
     if not keep_final_point:
         del logx_list[-1]  # remove point which violates termination condition
     return logx_list
 
 
 def generate_single_thread(settings, logx_end, thread_label, logx_start=0,
-                           keep_final_point=True):
+                           keep_final_point=True, rng=None):
     """
     Generates a samples array for a thread (single live point run) between
     logx_start and logx_end.
@@ -390,11 +427,15 @@ def generate_single_thread(settings, logx_end, thread_label, logx_start=0,
     logx_start: float, optional
     keep_final_point: bool, optional
         See generate_thread_logx docstring.
+    rng: numpy.random.Generator or None, optional
+        Random number generator to use. If None, the legacy numpy global
+        random state is used.
     """
     assert logx_start > logx_end, 'generate_single_thread: logx_start=' + \
         str(logx_start) + ' <= logx_end=' + str(logx_end)
     logx_list = generate_thread_logx(logx_end, logx_start=logx_start,
-                                     keep_final_point=keep_final_point)
+                                     keep_final_point=keep_final_point,
+                                     rng=rng)
     if not logx_list:  # PEP8 method for testing if sequence is empty
         return None
     else:
@@ -413,7 +454,8 @@ def generate_single_thread(settings, logx_end, thread_label, logx_start=0,
         lrxtn[-1, 4] = -1
         theta = mf.sample_nsphere_shells(lrxtn[:, 1],
                                          settings.n_dim,
-                                         settings.dims_to_sample)
+                                         settings.dims_to_sample,
+                                         rng=rng)
         return np.hstack([lrxtn, theta])
 
 
@@ -445,7 +487,9 @@ def point_importance(samples, thread_min_max, settings, simulate=False):
     """
     run_dict = dict_given_samples_array(samples, thread_min_max)
     logw = nestcheck.ns_run_utils.get_logw(run_dict, simulate=simulate)
-    w_relative = np.exp(logw - logw.max())
+    # get relative weights in place to avoid allocating temporary arrays
+    logw -= logw.max()
+    w_relative = np.exp(logw, out=logw)
     if settings.dynamic_goal == 0:
         return z_importance(w_relative, run_dict['nlive_array'])
     elif settings.dynamic_goal == 1:
@@ -455,9 +499,12 @@ def point_importance(samples, thread_min_max, settings, simulate=False):
         imp_z = z_importance(w_relative, run_dict['nlive_array'])
         imp_p = p_importance(run_dict['theta'], w_relative,
                              tuned_dynamic_p=settings.tuned_dynamic_p)
-        importance = (imp_z / np.sum(imp_z)) * (1.0 - settings.dynamic_goal)
-        importance += (imp_p / np.sum(imp_p)) * settings.dynamic_goal
-        return importance / importance.max()
+        # combine the scalar normalisation and weighting factors so each
+        # importance array is only scaled once
+        importance = imp_z * ((1.0 - settings.dynamic_goal) / np.sum(imp_z))
+        importance += imp_p * (settings.dynamic_goal / np.sum(imp_p))
+        importance /= importance.max()
+        return importance
 
 
 def z_importance(w_relative, nlive):
@@ -482,9 +529,12 @@ def z_importance(w_relative, nlive):
         Normalised so the biggest value in the array is equal to 1.
     """
     importance = np.cumsum(w_relative)
-    importance = importance.max() - importance
-    importance *= 1.0 / nlive
-    return importance / importance.max()
+    # Weights are non-negative so the cumulative sum's maximum is its final
+    # element; work in place to avoid allocating temporary arrays.
+    np.subtract(importance[-1], importance, out=importance)
+    importance /= nlive
+    importance /= importance.max()
+    return importance
 
 
 def p_importance(theta, w_relative, tuned_dynamic_p=False,
@@ -524,10 +574,11 @@ def p_importance(theta, w_relative, tuned_dynamic_p=False,
             ftheta = theta[:, 0]
         # calculate importance in proportion to difference between f values and
         # the calculation mean.
-        fabs = np.absolute(ftheta - (np.sum(ftheta * w_relative) /
-                                     np.sum(w_relative)))
-        importance = fabs * w_relative
-        return importance / importance.max()
+        importance = np.absolute(ftheta - (np.sum(ftheta * w_relative) /
+                                           np.sum(w_relative)))
+        importance *= w_relative
+        importance /= importance.max()
+        return importance
 
 
 def min_max_importance(importance, samples, settings):
@@ -540,7 +591,8 @@ def min_max_importance(importance, samples, settings):
     importance: 1d numpy array
         Relative importances of samples.
     samples: 2d numpy array
-        See dict_given_samples_arrry docstring for details of columns.
+        See dict_given_samples_arrry docstring for details of columns. Rows
+        must be sorted in order of increasing logl.
     settings: PerfectNSSettings object
 
     Returns
@@ -554,38 +606,57 @@ def min_max_importance(importance, samples, settings):
     assert settings.dynamic_fraction > 0. and settings.dynamic_fraction < 1., \
         'min_max_importance: settings.dynamic_fraction = ' + \
         str(settings.dynamic_fraction) + ' must be in [0, 1]'
+    logl = samples[:, 0]
     # where to start the additional threads:
     high_importance_inds = np.where(importance > settings.dynamic_fraction)[0]
     if high_importance_inds[0] == 0:  # start from sampling the whole prior
         logl_min = -np.inf
         logx_min = 0
     else:
-        logl_min = samples[:, 0][high_importance_inds[0] - 1]
+        logl_min = logl[high_importance_inds[0] - 1]
         # Use lookup to avoid recalculating the logx values (otherwise there
         # may be float comparison errors).
-        ind = np.where(samples[:, 0] == logl_min)[0]
-        assert ind.shape == (1,), \
-            'Should be one unique match for logl=logl_min=' + str(logl_min) + \
-            '. Instead we have matches at indexes ' + str(ind) + \
-            ' of the samples array (shape ' + str(samples.shape) + ')'
-        logx_min = samples[ind[0], 2]
+        logx_min = samples[unique_sorted_index(logl, logl_min), 2]
     # where to end the additional threads:
-    if high_importance_inds[-1] == samples[:, 0].shape[0] - 1:
+    if high_importance_inds[-1] == logl.shape[0] - 1:
         logl_max = samples[-1, 0]
         logx_max = samples[-1, 2]
     else:
-        logl_max = samples[:, 0][(high_importance_inds[-1] + 1)]
+        logl_max = logl[high_importance_inds[-1] + 1]
         # Use lookup to avoid recalculating the logx values (otherwise there
         # may be float comparison errors).
-        ind = np.where(samples[:, 0] == logl_max)[0]
-        assert ind.shape == (1,), \
-            'Should be one unique match for logl=logl_max=' + str(logl_max) + \
-            '.\n Instead we have matches at indexes ' + str(ind) + \
-            ' of the samples array (shape ' + str(samples.shape) + ')'
-        logx_max = samples[ind[0], 2]
+        logx_max = samples[unique_sorted_index(logl, logl_max), 2]
     return [logl_min, logl_max], [logx_min, logx_max]
 
 
+def unique_sorted_index(logl, value):
+    """
+    Find the index of value in a sorted array of logl values, checking it
+    appears exactly once.
+
+    Uses a binary search rather than comparing value with every element.
+
+    Parameters
+    ----------
+    logl: 1d numpy array
+        Logl values sorted in ascending order.
+    value: float
+
+    Returns
+    -------
+    int
+        Index of the unique element of logl equal to value.
+    """
+    ind_left = np.searchsorted(logl, value, side='left')
+    ind_right = np.searchsorted(logl, value, side='right')
+    assert ind_right - ind_left == 1, \
+        'Should be one unique match for logl=' + str(value) + \
+        '. Instead we have matches at indexes ' + \
+        str(np.arange(ind_left, ind_right)) + ' of the logl array (shape ' + \
+        str(logl.shape) + ')'
+    return ind_left
+
+
 def samples_array_given_run(ns_run):
     """
     Converts information on samples in a nested sampling run dictionary into a
@@ -641,9 +712,13 @@ def dict_given_samples_array(samples, thread_min_max):
         'theta'
         N.B. this does not contain a record of the run's settings.
     """
-    nlive_0 = (thread_min_max[:, 0] == -np.inf).sum()
-    nlive_array = np.zeros(samples.shape[0]) + nlive_0
-    nlive_array[1:] += np.cumsum(samples[:-1, 4])
+    # nlive is the number of threads sampling the whole prior plus the
+    # cumulative sum of the changes in nlive at previous samples; accumulate
+    # both in a single in-place cumsum.
+    nlive_array = np.empty(samples.shape[0])
+    nlive_array[0] = np.count_nonzero(thread_min_max[:, 0] == -np.inf)
+    nlive_array[1:] = samples[:-1, 4]
+    np.cumsum(nlive_array, out=nlive_array)
     assert nlive_array.min() > 0, (
         'nlive contains 0s or negative values!' +
         '\nnlive_array = ' + str(nlive_array) +
@@ -7,6 +7,7 @@ import warnings
 import copy
 import numpy as np
 import scipy
+import scipy.stats
 import matplotlib
 import matplotlib.patches
 import matplotlib.pyplot as plt
@@ -129,7 +130,8 @@ def plot_dynamic_nlive(dynamic_goals, settings_in, **kwargs):
         settings.tuned_dynamic_p = tuned_dynamic_ps[i]
         temp_runs = ns.get_run_data(settings, n_run, parallel=True,
                                     load=load, save=save)
-        n_samples = np.asarray([run['logl'].shape[0] for run in temp_runs])
+        n_samples = np.fromiter((run['logl'].shape[0] for run in temp_runs),
+                                dtype=int, count=len(temp_runs))
         n_sample_stats[i, 0] = np.mean(n_samples)
         n_sample_stats[i, 1] = np.std(n_samples, ddof=1)
         if i == 0 and settings.n_samples_max is None:
@@ -441,11 +443,9 @@ def posterior_cdf(estimator, values, logx, settings):
         logw = settings.logl_given_logx(logx) + logx
         w_rel = np.exp(logw - logw.max())
         pdf_posterior = np.zeros(cdf_fgivenx_temp.shape[0])
-        for i, _ in enumerate(pdf_posterior[:-1]):
-            # as we have no pdf_givenx this is caclulated from differences
-            # in cdf_fgivenx and therefor is 1 index smaller
-            pdf_posterior[i] = np.sum((cdf_fgivenx_temp[i + 1, :] -
-                                       cdf_fgivenx_temp[i, :]) * w_rel)
+        # as we have no pdf_givenx this is caclulated from differences
+        # in cdf_fgivenx and therefor is 1 index smaller
+        pdf_posterior[:-1] = np.diff(cdf_fgivenx_temp, axis=0).dot(w_rel)
         assert pdf_posterior.min() >= 0
         # calculate the cdf numerically from the pdf
         cdf = np.cumsum(pdf_posterior) / np.sum(pdf_posterior)
@@ -23,6 +23,7 @@ Prior classes may also optionally contain the inverse function
 
 import numpy as np
 import scipy
+import scipy.interpolate
 import perfectns.maths_functions as mf
 import perfectns.cached_gaussian_prior as cgp
 
@@ -115,8 +116,8 @@ class GaussianCached(object):
     """
     Spherically symmetric uniform prior.
     The scipy inverse gamma function is not numerically stable so cache
-    r_given_logx by using the mpmath logx_given_r and linearly
-    interpolating.
+    r_given_logx by using logx_given_r (which falls back on mpmath for very
+    small X) and linearly interpolating.
     """
     interp_d = {'n_dim': None, 'prior_scale': None}
 
@@ -179,16 +180,16 @@ class GaussianCached(object):
         self.check_cache(n_dim)
         if isinstance(logx, np.ndarray):
             r = np.zeros(logx.shape)
-            ind = np.where(logx <= self.interp_d['logx_array'].max())[0]
+            ind = logx <= self.interp_logx_max
             r[ind] = self.interp_f(logx[ind])
-            ind = np.where(logx > self.interp_d['logx_array'].max())[0]
+            ind = logx > self.interp_logx_max
             r[ind] = mf.gaussian_r_given_logx(logx[ind], self.prior_scale,
                                               n_dim)
             assert np.count_nonzero(r) == r.shape[0], \
                 'r contains zeros! r = ' + str(r)
             return r
         else:
-            if logx <= self.interp_d['logx_array'].max():
+            if logx <= self.interp_logx_max:
                 return self.interp_f(logx)
             else:
                 return mf.gaussian_r_given_logx(logx, self.prior_scale,
@@ -230,3 +231,6 @@ class GaussianCached(object):
                 logx_min=self.logx_min, interp_density=self.interp_density)
             self.interp_f = scipy.interpolate.interp1d(
                 self.interp_d['logx_array'], self.interp_d['r_array'])
+            # Store the upper limit of the interpolation so r_given_logx does
+            # not have to search the logx array for it on every call.
+            self.interp_logx_max = self.interp_d['logx_array'].max()
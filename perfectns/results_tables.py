@@ -6,6 +6,7 @@ Used for results in 'Dynamic nested sampling: an improved algorithm for nested
 sampling parameter estimation and evidence calculation' (Higson et al., 2019).
 """
 
+import os
 import copy
 import pandas as pd
 import numpy as np
@@ -108,7 +109,7 @@ def get_dynamic_results(n_run, dynamic_goals_in, estimator_list_in,
         save_root += '_' + str(dg).replace('.', '_')
     save_root += '_' + settings.save_name(include_dg=False)
     save_root += '_' + str(n_run) + 'reps'
-    save_file = cache_dir + '/' + save_root + '.pkl'
+    save_file = os.path.join(cache_dir, save_root + '.pkl')
     # try loading results
     if load:
         try:
@@ -137,8 +138,9 @@ def get_dynamic_results(n_run, dynamic_goals_in, estimator_list_in,
         if i != 0 and settings.dynamic_goal is not None:
             assert dynamic_goals[0] is None
             assert isinstance(estimator_list[0], e.CountSamples)
-            n_samples_max = np.mean(np.asarray([val[0] for val in
-                                                method_values[0]]))
+            n_samples_max = np.mean(np.fromiter(
+                (val[0] for val in method_values[0]), dtype=float,
+                count=len(method_values[0])))
             # This factor is a function of the dynamic goal as typically
             # evidence calculations have longer additional threads than
             # parameter estimation calculations.
@@ -335,7 +337,7 @@ def get_bootstrap_results(n_run, n_simulate, estimator_list, settings,
                  str(ninit_sep) + 'sep')
     save_root += '_' + settings.save_name()
     save_root += '_' + str(n_run) + 'reps'
-    save_file = cache_dir + '/' + save_root + '.pkl'
+    save_file = os.path.join(cache_dir, save_root + '.pkl')
     # try loading results
     if load:
         try:
@@ -436,19 +438,15 @@ def get_bootstrap_results(n_run, n_simulate, estimator_list, settings,
                  - bs_df.loc[('mean', 'value')].values)
     rep_values_array = np.stack(rep_values, axis=1)
     assert rep_values_array.shape == (len(estimator_list), n_run)
-    coverage = np.zeros(rep_values_array.shape[0])
-    for i, _ in enumerate(coverage):
-        ind = np.where((rep_values_array[i, :] > min_value[i]) &
-                       (rep_values_array[i, :] < max_value[i]))
-        coverage[i] = ind[0].shape[0] / rep_values_array.shape[1]
+    # Compare all estimators' values at once by broadcasting the bounds
+    # along each row of rep_values_array
+    coverage = np.mean((rep_values_array > min_value[:, None]) &
+                       (rep_values_array < max_value[:, None]), axis=1)
     # multiply by 100 to express as a percentage
     results.loc[('bs +-1std % coverage', 'value'), :] = coverage * 100
     # add credible interval coverage
     max_value = results.loc[('bs ' + str(cred_int) + ' CI', 'value')].values
-    ci_coverage = np.zeros(len(estimator_list))
-    for i, _ in enumerate(coverage):
-        ind = np.where(rep_values_array[i, :] < max_value[i])
-        ci_coverage[i] = ind[0].shape[0] / rep_values_array.shape[1]
+    ci_coverage = np.mean(rep_values_array < max_value[:, None], axis=1)
     # multiply by 100 to express as a percentage
     results.loc[('bs ' + str(cred_int) + ' CI % coverage', 'value'), :] = \
         (ci_coverage * 100)
@@ -55,7 +55,7 @@ setuptools.setup(name='perfectns',
                      'Topic :: Scientific/Engineering :: Information Analysis',
                  ],
                  packages=['perfectns'],
-                 install_requires=['numpy>=1.13',
+                 install_requires=['numpy>=1.17',
                                    'scipy>=1.0.0',
                                    'pandas',
                                    'matplotlib>=2.1.0',
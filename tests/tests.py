@@ -10,6 +10,7 @@ import warnings
 import numpy as np
 import numpy.testing
 import matplotlib
+import matplotlib.pyplot as plt
 import nestcheck.ns_run_utils
 import perfectns.settings
 import perfectns.estimators as e
@@ -21,6 +22,10 @@ import perfectns.maths_functions
 import perfectns.priors as priors
 import perfectns.plots
 
+# Use a non-interactive backend so the plotting tests do not need a display.
+# Switching after pyplot is imported is fine as no figures exist yet.
+plt.switch_backend('Agg')
+
 ESTIMATOR_LIST = [e.LogZ(),
                   e.Z(),
                   e.ParamMean(),
@@ -33,6 +38,9 @@ TEST_CACHE_DIR = 'cache_tests'
 TEST_DIR_EXISTS_MSG = ('Directory ' + TEST_CACHE_DIR + ' exists! Tests use '
                        'this dir to check caching then delete it afterwards, '
                        'so the path should be left empty.')
+# Generator for the tests' own random inputs (runs which are checked against
+# stored values use the legacy global random state via random_seed)
+RNG = np.random.default_rng(0)
 
 
 class TestNestedSampling(unittest.TestCase):
@@ -43,10 +51,7 @@ class TestNestedSampling(unittest.TestCase):
 
     def tearDown(self):
         """Remove any caches created by the tests."""
-        try:
-            shutil.rmtree(TEST_CACHE_DIR)
-        except FileNotFoundError:
-            pass
+        shutil.rmtree(TEST_CACHE_DIR, ignore_errors=True)
 
     def test_nestcheck_run_format(self):
         """
@@ -69,6 +74,20 @@ class TestNestedSampling(unittest.TestCase):
                 # maintain compatibility with earlier versions
                 pass
 
+    def test_generate_ns_run_rng(self):
+        """Check runs generated with a numpy Generator are reproducible."""
+        settings = get_minimal_settings()
+        for dynamic_goal in [None, 1]:
+            settings.dynamic_goal = dynamic_goal
+            run = ns.generate_ns_run(settings, rng=np.random.default_rng(0))
+            run_repeat = ns.generate_ns_run(
+                settings, rng=np.random.default_rng(0))
+            for key in ['logl', 'theta', 'nlive_array']:
+                numpy.testing.assert_array_equal(run[key], run_repeat[key])
+        # A random_seed would be ignored when rng is given
+        self.assertRaises(AssertionError, ns.generate_ns_run, settings,
+                          random_seed=3, rng=np.random.default_rng(0))
+
     def test_get_run_data_caching(self):
         settings = get_minimal_settings()
         settings.dynamic_goal = None
@@ -112,14 +131,29 @@ class TestNestedSampling(unittest.TestCase):
         ones with high importance.
         """
         settings = get_minimal_settings()
-        samples = np.random.random((2, 3))
+        samples = RNG.random((2, 3))
+        samples = samples[np.argsort(samples[:, 0])]
         loglmm, logxmm = ns.min_max_importance(np.full(2, 1), samples,
                                                settings)
         self.assertEqual(loglmm[1], samples[-1, 0])
         self.assertEqual(logxmm[1], samples[-1, 2])
+        # Check the lookups used when the high importance region is inside
+        # the run
+        samples = RNG.random((5, 3))
+        samples = samples[np.argsort(samples[:, 0])]
+        loglmm, logxmm = ns.min_max_importance(
+            np.asarray([0., 0., 1., 1., 0.]), samples, settings)
+        self.assertEqual(loglmm, [samples[1, 0], samples[4, 0]])
+        self.assertEqual(logxmm, [samples[1, 2], samples[4, 2]])
+
+    def test_unique_sorted_index(self):
+        logl = np.asarray([-3., -2., -2., 1.])
+        self.assertEqual(ns.unique_sorted_index(logl, 1.), 3)
+        self.assertRaises(AssertionError, ns.unique_sorted_index, logl, -2.)
+        self.assertRaises(AssertionError, ns.unique_sorted_index, logl, 0.)
 
     def test_tuned_p_importance(self):
-        theta = np.random.random((5, 1))
+        theta = RNG.random((5, 1))
         w_rel = np.full(5, 1)
         imp = np.abs(theta - np.mean(theta))[:, 0]
         imp /= imp.max()
@@ -170,6 +204,36 @@ class TestEstimators(unittest.TestCase):
             e.get_true_estimator_values(e.RMean(), self.settings),
             1.2470645289408879e+00, places=10)
 
+    def test_check_by_integrating_cache(self):
+        e.clear_integration_cache()
+        value = e.get_true_estimator_values(e.RMean(), self.settings)
+        self.assertEqual(len(e.INTEGRATION_CACHE), 1)
+        self.assertEqual(
+            e.get_true_estimator_values(e.RMean(), self.settings), value)
+        self.assertEqual(len(e.INTEGRATION_CACHE), 1)
+        # Changing the likelihood should not reuse the cached value
+        self.settings.likelihood = likelihoods.Gaussian(likelihood_scale=2)
+        self.assertNotEqual(
+            e.get_true_estimator_values(e.RMean(), self.settings), value)
+        self.assertEqual(len(e.INTEGRATION_CACHE), 2)
+        # The least recently used value is dropped when the cache is full
+        cache_size = e.INTEGRATION_CACHE_SIZE
+        e.INTEGRATION_CACHE_SIZE = 2
+        try:
+            e.get_true_estimator_values(e.ParamSquaredMean(), self.settings)
+        finally:
+            e.INTEGRATION_CACHE_SIZE = cache_size
+        self.assertEqual(len(e.INTEGRATION_CACHE), 2)
+        self.assertNotIn((e.RMean.ftilde, e.integration_settings_key(
+            get_minimal_settings())), e.INTEGRATION_CACHE)
+        e.clear_integration_cache()
+        self.assertEqual(len(e.INTEGRATION_CACHE), 0)
+        # GaussianCached interpolation settings are part of the key
+        self.settings.prior = priors.GaussianCached(10, interp_density=10)
+        key = e.integration_settings_key(self.settings)
+        self.settings.prior = priors.GaussianCached(10, interp_density=5)
+        self.assertNotEqual(key, e.integration_settings_key(self.settings))
+
     def test_true_r_cred_value(self):
         self.assertTrue(np.isnan(
             e.get_true_estimator_values(e.RCred(0.84), self.settings)))
@@ -202,6 +266,16 @@ class TestMathsFunctions(unittest.TestCase):
         self.assertIsNone(
             perfectns.maths_functions.analytic_logx_terminate(settings))
 
+    def test_gaussian_logx_given_r_near_zero(self):
+        """
+        Check precision for logx close to zero. In 2d the Gaussian prior
+        volume has the closed form X = 1 - exp(-r^2 / 2).
+        """
+        r = np.asarray([1., 3., 6.])
+        numpy.testing.assert_allclose(
+            perfectns.maths_functions.gaussian_logx_given_r(r, 1, 2),
+            np.log1p(-np.exp(-0.5 * r ** 2)), rtol=1e-13)
+
     def test_nsphere_sampling(self):
         # By default only used in high dim so manually test with dim=100
         perfectns.maths_functions.sample_nsphere_shells(
@@ -213,6 +287,39 @@ class TestMathsFunctions(unittest.TestCase):
         self.assertEqual(
             perfectns.maths_functions.sample_nsphere_shells_beta(
                 np.asarray([1]), 2, n_sample=None).shape, (1, 2))
+        # Check sampling with a numpy Generator
+        thetas = perfectns.maths_functions.sample_nsphere_shells(
+            np.asarray([1, 2]), 100, n_sample=1,
+            rng=np.random.default_rng(0))
+        self.assertEqual(thetas.shape, (2, 1))
+        # Check the normal sampler when only some of the dimensions are
+        # returned (the rest are accounted for with a chi-squared draw)
+        r = np.linspace(0.5, 3, 20)
+        thetas = perfectns.maths_functions.sample_nsphere_shells_normal(
+            r, 10, n_sample=3, rng=np.random.default_rng(0))
+        self.assertEqual(thetas.shape, (20, 3))
+        self.assertTrue(np.all(np.sum(thetas ** 2, axis=1) <= r ** 2))
+        # By symmetry each coordinate has E[theta_i^2] = r^2 / n_dim, which
+        # only holds if the chi-squared draw has the right degrees of freedom
+        thetas = perfectns.maths_functions.sample_nsphere_shells_normal(
+            np.full(20000, 2.), 10, n_sample=3, rng=np.random.default_rng(1))
+        std_err = np.std(thetas ** 2) / np.sqrt(thetas.size)
+        self.assertLess(abs(np.mean(thetas ** 2) - 0.4), 4 * std_err)
+        # With every dimension returned, samples lie on the shells
+        thetas = perfectns.maths_functions.sample_nsphere_shells_normal(
+            r, 10, n_sample=10, rng=np.random.default_rng(0))
+        numpy.testing.assert_allclose(
+            np.sqrt(np.sum(thetas ** 2, axis=1)), r, rtol=1e-13)
+        # The legacy random state draws every coordinate, so seeded runs are
+        # unchanged
+        np.random.seed(0)
+        thetas = perfectns.maths_functions.sample_nsphere_shells_normal(
+            r, 10, n_sample=3)
+        np.random.seed(0)
+        expected = np.random.normal(size=(20, 10))
+        expected = (expected[:, :3] *
+                    (r / np.sqrt(np.sum(expected ** 2, axis=1)))[:, None])
+        numpy.testing.assert_allclose(thetas, expected, rtol=1e-13)
 
 
 class TestSettings(unittest.TestCase):
@@ -274,10 +381,7 @@ class TestPriors(unittest.TestCase):
 
     def tearDown(self):
         """Remove any caches created by the tests."""
-        try:
-            shutil.rmtree(TEST_CACHE_DIR)
-        except FileNotFoundError:
-            pass
+        shutil.rmtree(TEST_CACHE_DIR, ignore_errors=True)
 
     def test_standard_ns_gaussian_likelihood_uniform_prior(self):
         """Check the uniform prior."""
@@ -335,6 +439,10 @@ class TestPriors(unittest.TestCase):
 
 class TestPlotting(unittest.TestCase):
 
+    def tearDown(self):
+        """Close the figures made by the test to free their memory."""
+        plt.close('all')
+
     def test_plot_dynamic_nlive(self):
         settings = get_minimal_settings()
         fig = perfectns.plots.plot_dynamic_nlive(
@@ -390,10 +498,7 @@ class TestDynamicResultsTables(unittest.TestCase):
 
     def tearDown(self):
         """Remove any caches created by the tests."""
-        try:
-            shutil.rmtree(TEST_CACHE_DIR)
-        except FileNotFoundError:
-            pass
+        shutil.rmtree(TEST_CACHE_DIR, ignore_errors=True)
 
     def test_dynamic_results_table_values(self):
         """
@@ -454,10 +559,7 @@ class TestBootstrapResultsTables(unittest.TestCase):
 
     def tearDown(self):
         """Remove any caches created by the tests."""
-        try:
-            shutil.rmtree(TEST_CACHE_DIR)
-        except FileNotFoundError:
-            pass
+        shutil.rmtree(TEST_CACHE_DIR, ignore_errors=True)
 
     def test_bootstrap_results_table_values(self):
         """